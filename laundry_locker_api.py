@@ -11,56 +11,111 @@ import RPi.GPIO as GPIO
 import time
 from mfrc522 import SimpleMFRC522
 import json
+import orjson
 import os
+import gzip
+import hashlib
+import hmac
+import shutil
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import uuid
-from datetime import datetime, timedelta  # Add timedelta here
+from datetime import datetime
+from decimal import Decimal
 import threading
+import queue
+import heapq
+import signal
+import atexit
 import sys
-from flask import Flask, request, jsonify, abort
+from typing import Optional, Union
+import msgspec
+from flask import Flask, Response, request, jsonify, abort, make_response
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from logging.handlers import RotatingFileHandler
+from waitress import serve
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler, QueueHandler, QueueListener
 
 # Configure logging with rotation to prevent huge log files
 log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
+
+def gzip_log_namer(name):
+    """Name rotated log files with a .gz suffix"""
+    return name + ".gz"
+
+
+def gzip_log_rotator(source, dest):
+    """Compress the rolled-over log file"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
 # Main logger
 main_handler = RotatingFileHandler(
     "/home/pi/laundry_locker_system.log",
-    maxBytes=10*1024*1024,  # 10MB
-    backupCount=5
+    maxBytes=50*1024*1024,  # 50MB - rotation is expensive, keep it rare
+    backupCount=3
 )
 main_handler.setFormatter(log_formatter)
 
-# RFID specific logger
-rfid_handler = RotatingFileHandler(
-    "/home/pi/rfid_reader.log", 
-    maxBytes=5*1024*1024,  # 5MB
-    backupCount=3
+# RFID specific logger - rotated once a day at midnight, when the kiosk is idle
+rfid_handler = TimedRotatingFileHandler(
+    "/home/pi/rfid_reader.log",
+    when="midnight",
+    backupCount=7,
+    encoding="utf-8"
 )
+rfid_handler.namer = gzip_log_namer
+rfid_handler.rotator = gzip_log_rotator
 rfid_handler.setFormatter(log_formatter)
 
 # Console handler
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(log_formatter)
 
+# Log calls only enqueue records; a listener thread per logger does the file/console I/O
+main_log_queue = queue.Queue(-1)
+main_listener = QueueListener(main_log_queue, main_handler, console_handler, respect_handler_level=True)
+rfid_log_queue = queue.Queue(-1)
+rfid_listener = QueueListener(rfid_log_queue, rfid_handler, console_handler, respect_handler_level=True)
+
 # Main logger setup
 logger = logging.getLogger("main")
 logger.setLevel(logging.INFO)
-logger.addHandler(main_handler)
-logger.addHandler(console_handler)
+logger.addHandler(QueueHandler(main_log_queue))
 
-# RFID logger setup - more verbose
+# RFID logger setup - DEBUG only when rfid_debug_logging is enabled in the config
 rfid_logger = logging.getLogger("rfid")
-rfid_logger.setLevel(logging.DEBUG)
-rfid_logger.addHandler(rfid_handler)
-rfid_logger.addHandler(console_handler)
+rfid_logger.setLevel(logging.INFO)
+rfid_logger.addHandler(QueueHandler(rfid_log_queue))
+
+main_listener.start()
+rfid_listener.start()
+
+# Drain queued records on shutdown
+atexit.register(main_listener.stop)
+atexit.register(rfid_listener.stop)
 
 # Configuration
 CONFIG_FILE = "/home/pi/locker_config.json"
-DB_FILE = "/home/pi/locker_data.json"
+DB_FILE = "/home/pi/locker_data.json"  # Legacy single-file database, migrated on startup
+STATE_FILE = "/home/pi/locker_state.json"  # Live locker state, rewritten on change
+TRANSACTION_LOG = "/home/pi/transactions.log"  # Append-only NDJSON transaction history
+TRANSACTION_ARCHIVE = "/home/pi/transactions_archive.ndjson.gz"  # Old completed transactions
 SERVER_URL = "https://api.2sdata.net/api"  # Replace with your server URL
+SAVE_DELAY = 2  # seconds to batch database changes before writing to disk
+SYNC_INTERVAL = 300  # seconds between status syncs with the server
+EVENT_BATCH_SIZE = 50  # max events sent to the server in one request
+EVENT_MAX_ATTEMPTS = 5  # deliveries tried before an event is dropped
+EVENT_RETRY_DELAY = 10  # seconds to wait after a failed batch
+ARCHIVE_INTERVAL = 24 * 60 * 60  # seconds between transaction archive runs
+STATUS_CACHE_TTL = 0.5  # seconds a status/health snapshot is reused for polling clients
+WASH_TYPES_RETRY_DELAY = 30  # seconds fallback wash types are served before retrying the server
+WASH_TYPES_MIN_REFRESH = 10  # minimum seconds between server fetches forced by invalidation
 
 # Default configuration
 DEFAULT_CONFIG = {
@@ -83,45 +138,66 @@ DEFAULT_CONFIG = {
     "api_port": 5000,
     "api_host": "0.0.0.0",  # Listen on all interfaces
     "rfid_read_timeout": 30,  # seconds
-    "card_validity_window": 30  # seconds
+    "rfid_irq_pin": None,  # BCM pin wired to the MFRC522 IRQ line (e.g. 24), None to poll the reader
+    "card_validity_window": 30,  # seconds
+    "rfid_debug_logging": False,  # Log every RFID poll detail to rfid_reader.log
+    "transaction_retention_days": 30,  # Completed transactions older than this are archived
+    "wash_types_cache_ttl": 60  # Seconds to reuse wash types fetched from the server
 }
 
+def iso_timestamp(epoch_seconds):
+    """Format a time.time() value the way the API reports times"""
+    return datetime.fromtimestamp(epoch_seconds).isoformat()
+
+
+def json_body_with_etag(obj):
+    """Serialize a response body once, returning the bytes with their ETag"""
+    payload = orjson.dumps(obj)
+    return payload, hashlib.md5(payload).hexdigest()
+
+
+def normalize_card_id(card_id):
+    """Canonical form for card IDs so lookups can use plain dict membership"""
+    return str(card_id).strip().lower()
+
+
 class LockerTransaction:
     """Class to represent a locker transaction"""
     def __init__(self, card_id, locker_id, wash_type=None, status="pending", device_info=None):
         self.transaction_id = str(uuid.uuid4())
         self.card_id = card_id
         self.locker_id = locker_id
-        self.wash_type = wash_type
+        # Keep the wash type flat (name + price) - this is the shape the server expects
+        self.wash_type_name = wash_type.get('name', 'Unknown') if wash_type else None
+        self.wash_type_price = wash_type.get('price') if wash_type else None
         self.status = status  # pending, processing, completed
-        self.drop_off_time = datetime.now().isoformat()
-        self.pickup_time = None
+        self.drop_off_ts = time.time()  # Formatted only when the transaction is serialized
+        self.pickup_ts = None
         self.device_info = device_info or {}  # Store device information
         
         # Add estimated completion time based on wash type if available
         if wash_type and 'estimated_time' in wash_type:
-            drop_off_datetime = datetime.now()
-            minutes_to_add = wash_type['estimated_time']
-            self.estimated_completion_time = (drop_off_datetime + timedelta(minutes=minutes_to_add)).isoformat()
+            self.estimated_completion_ts = self.drop_off_ts + wash_type['estimated_time'] * 60
         else:
-            self.estimated_completion_time = None
+            self.estimated_completion_ts = None
 
     def to_dict(self):
         return {
             "transaction_id": self.transaction_id,
             "card_id": self.card_id,
             "locker_id": self.locker_id,
-            "wash_type": self.wash_type,
+            "wash_type": self.wash_type_name,
+            "wash_type_price": self.wash_type_price,
             "status": self.status,
-            "drop_off_time": self.drop_off_time,
-            "pickup_time": self.pickup_time,
-            "estimated_completion_time": self.estimated_completion_time,
+            "drop_off_time": iso_timestamp(self.drop_off_ts),
+            "pickup_time": None if self.pickup_ts is None else iso_timestamp(self.pickup_ts),
+            "estimated_completion_time": None if self.estimated_completion_ts is None else iso_timestamp(self.estimated_completion_ts),
             "device_info": self.device_info  # Include device info in output
         }
 
     def complete_transaction(self):
         self.status = "completed"
-        self.pickup_time = datetime.now().isoformat()
+        self.pickup_ts = time.time()
 
 
 class RFIDLockerSystem:
@@ -129,77 +205,170 @@ class RFIDLockerSystem:
         logger.info("Initializing RFID Laundry Locker System...")
         self.load_config()
         
+        # Keep-alive HTTP session so server calls reuse the TCP/TLS connection
+        self.http = requests.Session()
+        self.http.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=Retry(total=2, backoff_factor=0.3))
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        
+        # Wash types fetched from the server, reused until the TTL expires
+        self.server_wash_types = None  # Last list the server returned, kept as a fallback
+        self._wash_types_cache = None
+        self._wash_types_expires = 0  # time.monotonic() after which the cache is refetched
+        self._wash_types_fetched_at = 0  # time.monotonic() of the last server fetch
+        self._wash_types_lock = threading.Lock()
+        self._wash_types_inflight = None  # Event set when the running server fetch finishes
+        self.refresh_wash_types_async()  # Have the server list ready before the first drop-off
+        
         # Set up GPIO
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         
         # Set up relay pins as outputs
-        self.relay_pins = {}
-        for locker_id, pin in self.config["relay_pins"].items():
+        for locker_id, pin in self.relay_pin_map.items():
             GPIO.setup(pin, GPIO.OUT)
             GPIO.output(pin, GPIO.HIGH)  # Relays are typically active LOW
-            self.relay_pins[locker_id] = pin
+        
+        # Relays are re-locked by one background thread from a heap of (deadline, locker_id)
+        self._relay_heap = []
+        self._relay_deadlines = {}  # locker_id -> deadline of its most recent unlock
+        self._relay_cond = threading.Condition()
+        self.relay_thread = threading.Thread(target=self._relay_closer_loop, daemon=True)
+        self.relay_thread.start()
+        
+        # Card detection is interrupt driven when the MFRC522 IRQ line (rfid_irq_pin) is wired up
+        self.card_event = threading.Event()
         
         # Initialize RFID reader with improved method
+        self.reader = None
         self.initialize_rfid()
         
+        # State writes are batched by a background thread; transactions are appended to a log
+        self._dirty = threading.Event()
+        self._save_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        
         # Load data
         self.data = self.load_data()
         logger.info(f"Loaded system data with {len(self.data['active_cards'])} active cards and {len(self.data['transactions'])} transactions")
         
-        # Start server communication thread
+        self.save_thread = threading.Thread(target=self.save_data_loop, daemon=True)
+        self.save_thread.start()
+        
+        # Start server communication thread; events are queued for it to send in batches
+        self.event_q = queue.Queue(maxsize=1000)
+        self._last_sync_signature = None  # Summary last accepted by the server
+        self._unsynced_tx_ids = set()  # Transactions whose events were dropped, resent with the next sync
+        self._unsynced_lock = threading.Lock()
         self.server_thread = threading.Thread(target=self.sync_with_server_loop, daemon=True)
         self.server_thread.start()
         
-        # Setup RFID card reading queue with thread-safe access
-        self.card_queue = []
-        self.card_read_lock = threading.Lock()
-        self.rfid_thread = threading.Thread(target=self.rfid_reader_loop, daemon=True)
-        self.rfid_thread.start()
-        
-        # Track RFID reader health
+        # Track RFID reader health (before the reader thread starts updating it)
         self.last_successful_read = None
         self.rfid_errors = 0
         self.rfid_reads_attempted = 0
         self.rfid_reads_successful = 0
+        
+        # Short-lived status/health snapshots shared by polling clients
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+        
+        # Setup RFID card reading queue - queue.Queue does its own locking
+        # Bounded to the last 10 card reads; card_latest maps card_id -> its latest queue entry
+        self.card_queue = queue.Queue(maxsize=10)
+        self.card_latest = {}
+        self.card_latest_lock = threading.Lock()
+        self.rfid_thread = threading.Thread(target=self.rfid_reader_loop, daemon=True)
+        self.rfid_thread.start()
 
     def initialize_rfid(self):
-        """Initialize RFID reader with enhanced error handling and recovery"""
+        """Initialize the RFID reader, or soft-reset it in place during recovery"""
         rfid_logger.info("Initializing RFID reader")
         try:
-            # Release GPIO resources completely before reinitializing
-            GPIO.cleanup()
-            time.sleep(1.0)  # Increased delay to ensure full reset
-            
-            # Set up GPIO again
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            
-            # Set up relay pins as outputs again
-            for locker_id, pin in self.config["relay_pins"].items():
-                GPIO.setup(pin, GPIO.OUT)
-                GPIO.output(pin, GPIO.HIGH)  # Relays are typically active LOW
+            if self.reader is None:
+                # Initialize RFID reader with SPI communication validation
+                self.reader = SimpleMFRC522()
+                
+                # Wake the reader thread from the IRQ line instead of polling
+                if self.rfid_irq_pin is not None:
+                    GPIO.setup(self.rfid_irq_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+                    GPIO.add_event_detect(self.rfid_irq_pin, GPIO.FALLING, callback=self._on_rfid_irq)
+                    rfid_logger.info("RFID card detection using IRQ on GPIO %s", self.rfid_irq_pin)
+            else:
+                # Recovery only touches the MFRC522 - relay GPIO stays as it is
+                self.soft_reset_rfid()
             
-            # Initialize RFID reader with SPI communication validation
-            self.reader = SimpleMFRC522()
+            if self.rfid_irq_pin is not None:
+                self.arm_rfid_irq()
             
-            # Test the reader is working by checking the card reader's presence
-            # This is a more reliable way to verify the RFID reader is connected
             rfid_logger.info("RFID reader initialized successfully")
             self.last_rfid_init = time.time()
             return True
         except Exception as e:
-            rfid_logger.critical(f"Failed to initialize RFID reader: {e}", exc_info=True)
+            rfid_logger.critical("Failed to initialize RFID reader: %s", e, exc_info=True)
             return False
-    
+
+    def soft_reset_rfid(self):
+        """Reset the MFRC522 chip over SPI, reopening the SPI device if the chip doesn't respond"""
+        mfrc = self.reader.READER
+        try:
+            mfrc.Write_MFRC522(mfrc.CommandReg, mfrc.PCD_RESETPHASE)
+            
+            # PowerDown is set during the reset and clears once the oscillator is running again
+            deadline = time.monotonic() + 0.05
+            while mfrc.Read_MFRC522(mfrc.CommandReg) & 0x10:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("MFRC522 did not come out of soft reset")
+                time.sleep(0.005)
+            
+            # Restore the register setup from MFRC522_Init (minus its reset) and enable the antenna
+            mfrc.Write_MFRC522(mfrc.TModeReg, 0x8D)
+            mfrc.Write_MFRC522(mfrc.TPrescalerReg, 0x3E)
+            mfrc.Write_MFRC522(mfrc.TReloadRegL, 30)
+            mfrc.Write_MFRC522(mfrc.TReloadRegH, 0)
+            mfrc.Write_MFRC522(mfrc.TxAutoReg, 0x40)
+            mfrc.Write_MFRC522(mfrc.ModeReg, 0x3D)
+            mfrc.AntennaOn()
+        except Exception as e:
+            rfid_logger.warning("Soft reset failed (%s), reopening SPI", e)
+            mfrc.spi.close()
+            self.reader = SimpleMFRC522()
+
+    def _on_rfid_irq(self, channel):
+        """GPIO edge callback - the MFRC522 pulled its IRQ line low"""
+        self.card_event.set()
+
+    def arm_rfid_irq(self):
+        """Ask the MFRC522 to probe for a tag and assert IRQ when one answers"""
+        mfrc = self.reader.READER
+        self.card_event.clear()
+        
+        mfrc.Write_MFRC522(mfrc.CommIrqReg, 0x7F)  # Clear all pending interrupt bits
+        mfrc.Write_MFRC522(mfrc.CommIEnReg, 0xA0)  # IRQ pin active low, interrupt on RxIRq only
+        mfrc.Write_MFRC522(mfrc.FIFOLevelReg, 0x80)  # Flush the FIFO
+        mfrc.Write_MFRC522(mfrc.FIFODataReg, mfrc.PICC_REQIDL)
+        mfrc.Write_MFRC522(mfrc.CommandReg, mfrc.PCD_TRANSCEIVE)
+        mfrc.Write_MFRC522(mfrc.BitFramingReg, 0x87)  # StartSend, 7-bit short frame for REQA
+
+    def wait_for_card(self, timeout=1.0):
+        """Block until the IRQ line reports a tag; re-arm detection if none arrives"""
+        if self.card_event.wait(timeout):
+            mfrc = self.reader.READER
+            # Reads toggle the IRQ line too, so only trust the edge if a tag answered
+            if mfrc.Read_MFRC522(mfrc.CommIrqReg) & 0x20:
+                return True
+        
+        # A REQA only probes the field once, so issue a fresh one
+        self.arm_rfid_irq()
+        return False
 
     def load_config(self):
         """Load system configuration"""
         if not os.path.exists(CONFIG_FILE):
             # Create default configuration
             self.config = DEFAULT_CONFIG
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(self.config, f, indent=4)
+            self.save_config()
             logger.info("Created default configuration file")
         else:
             try:
@@ -209,112 +378,371 @@ class RFIDLockerSystem:
             except Exception as e:
                 logger.error(f"Error loading configuration: {e}")
                 self.config = DEFAULT_CONFIG
+        
+        self._index_wash_types(self.config["wash_types"])
+        
+        rfid_logger.setLevel(logging.DEBUG if self.config.get("rfid_debug_logging") else logging.INFO)
+        
+        # Settings read on hot paths, resolved once
+        self.card_validity_window = self.config.get('card_validity_window', 30)
+        self.unlock_duration = self.config['unlock_duration']
+        self.relay_pin_map = {str(k): v for k, v in self.config['relay_pins'].items()}
+        self.rfid_irq_pin = self.config.get("rfid_irq_pin")
+        self.wash_types_cache_ttl = self.config.get("wash_types_cache_ttl", 60)
+        self.refresh_device_info()
+
+    def save_config(self):
+        """Write the configuration file atomically, keeping it readable for hand edits"""
+        self._write_json_atomic(CONFIG_FILE, self.config, orjson.OPT_INDENT_2)
+
+    def refresh_device_info(self):
+        """Rebuild the device info shared by every new transaction.
+
+        The dict is handed to transactions by reference, so it is never
+        mutated - a config change replaces it with a new one instead.
+        """
+        self._device_info = {
+            "device_name": self.config.get("device_name"),
+            "device_location": self.config.get("device_location")
+        }
+        self._device_info_payload = json_body_with_etag({
+            "device_name": self.config.get("device_name", "unknown-device"),
+            "device_location": self.config.get("device_location", "unknown-location"),
+            "system_name": self.config.get("system_name", "Laundry Locker System"),
+            "api_version": "1.1.0",  # Add version information
+            "uptime": "unknown",  # You could add real uptime tracking if needed
+        })
+
+    def _index_wash_types(self, wash_types):
+        """Build the lookups and the /api/wash-types payload for the currently active wash type list"""
+        # Local configuration lacks the fields the UI shows - add them for compatibility
+        if not any('description' in wt for wt in wash_types):
+            for wash_type in wash_types:
+                if 'description' not in wash_type:
+                    wash_type['description'] = f"{wash_type['name']} service"
+                if 'estimated_time' not in wash_type:
+                    wash_type['estimated_time'] = 60  # Default 60 minutes
+        
+        self._wash_types_by_id = {wt['id']: wt for wt in wash_types}
+        self._wash_types_by_name = {wt['name']: wt['id'] for wt in wash_types}
+        self._wash_types_payload = json_body_with_etag(wash_types)
 
     def load_data(self):
-        """Load system data from database file"""
-        if not os.path.exists(DB_FILE):
-            # Create default database
-            default_data = {
-                "active_cards": {},  # card_id -> user_info
-                "transactions": [],  # list of transaction objects
-                "available_lockers": list(self.config["relay_pins"].keys())
-            }
-            with open(DB_FILE, 'w') as f:
-                json.dump(default_data, f, indent=4)
-            return default_data
+        """Load locker state and rebuild transactions by replaying the transaction log"""
+        if not os.path.exists(STATE_FILE) and os.path.exists(DB_FILE):
+            return self._migrate_legacy_db()
+        
+        data = {
+            "active_cards": {},  # card_id -> user_info
+            "transactions": {},  # transaction_id -> transaction object
+            "available_lockers": list(self.config["relay_pins"].keys())
+        }
+        
+        if os.path.exists(STATE_FILE):
+            try:
+                with open(STATE_FILE, 'rb') as f:
+                    state = orjson.loads(f.read())
+                data["active_cards"] = state["active_cards"]
+                data["available_lockers"] = state["available_lockers"]
+            except Exception as e:
+                logger.error(f"Error loading locker state: {e}")
+        else:
+            self._write_json_atomic(STATE_FILE, self._state_snapshot(data))
+        
+        data["transactions"] = self._replay_transactions()
+        
+        # by_card is derived from the open transactions
+        return self._migrate_data(data)
+
+    def _replay_transactions(self):
+        """Read the transaction log; later entries for a transaction supersede earlier ones"""
+        transactions = {}
+        if not os.path.exists(TRANSACTION_LOG):
+            return transactions
+        
+        try:
+            with open(TRANSACTION_LOG, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        trans = orjson.loads(line)
+                    except ValueError:
+                        # A crash can leave a partial last line behind
+                        logger.warning("Skipping unreadable transaction log entry")
+                        continue
+                    transactions[trans["transaction_id"]] = trans
+        except Exception as e:
+            logger.error(f"Error reading transaction log: {e}")
         
+        return transactions
+
+    def _migrate_legacy_db(self):
+        """Split the old single-file database into the state file and transaction log"""
+        logger.info(f"Migrating {DB_FILE} to {STATE_FILE} and {TRANSACTION_LOG}")
         try:
             with open(DB_FILE, 'r') as f:
-                return json.load(f)
+                data = self._migrate_data(json.load(f))
         except Exception as e:
             logger.error(f"Error loading database: {e}")
-            return {"active_cards": {}, "transactions": [], "available_lockers": list(self.config["relay_pins"].keys())}
+            return {"active_cards": {}, "transactions": {}, "by_card": {}, "available_lockers": list(self.config["relay_pins"].keys())}
+        
+        self._rewrite_transaction_log(data["transactions"])
+        self._write_json_atomic(STATE_FILE, self._state_snapshot(data))
+        os.replace(DB_FILE, DB_FILE + ".migrated")
+        return data
+
+    def _migrate_data(self, data):
+        """Upgrade older data layouts and rebuild the derived card indexes"""
+        if isinstance(data.get("transactions"), list):
+            logger.info("Migrating transaction list to transaction_id index")
+            data["transactions"] = {
+                trans["transaction_id"]: trans
+                for trans in data["transactions"]
+                if trans.get("transaction_id")
+            }
+        
+        # Flatten wash types stored as full dicts by older versions
+        for trans in data["transactions"].values():
+            wash_type = trans.get("wash_type")
+            if isinstance(wash_type, dict):
+                trans["wash_type"] = wash_type.get("name", "Unknown")
+                trans["wash_type_price"] = wash_type.get("price")
+        
+        # Re-key active cards stored before card IDs were normalized
+        data["active_cards"] = {
+            normalize_card_id(card_id): info
+            for card_id, info in data["active_cards"].items()
+        }
+        
+        data["by_card"] = {
+            normalize_card_id(trans["card_id"]): transaction_id
+            for transaction_id, trans in data["transactions"].items()
+            if trans.get("status") != "completed" and trans.get("card_id")
+        }
+        
+        # The transaction log is written before the state file, so after a crash
+        # the log wins: restore open assignments and release completed ones
+        for card_id, transaction_id in data["by_card"].items():
+            if card_id not in data["active_cards"]:
+                locker_id = str(data["transactions"][transaction_id]["locker_id"])
+                data["active_cards"][card_id] = {"locker_id": locker_id, "transaction_id": transaction_id}
+                logger.warning("Restored card %s in locker %s from the transaction log", card_id, locker_id)
+        
+        released = []
+        for card_id, info in list(data["active_cards"].items()):
+            trans = data["transactions"].get(info.get("transaction_id"))
+            if trans is not None and trans.get("status") == "completed":
+                del data["active_cards"][card_id]
+                released.append(str(info["locker_id"]))
+                logger.warning("Released locker %s of completed transaction for card %s", info["locker_id"], card_id)
+        
+        occupied = {str(info["locker_id"]) for info in data["active_cards"].values()}
+        available = [locker for locker in data["available_lockers"] if locker not in occupied]
+        for locker in released:
+            if locker not in occupied and locker not in available:
+                available.append(locker)
+        data["available_lockers"] = available
+        
+        return data
 
     def save_data(self):
-        """Save system data to database file"""
+        """Mark the locker state as changed; the save thread writes it out shortly after"""
+        self._dirty.set()
+
+    def save_data_loop(self):
+        """Background thread that batches state changes into a single write"""
+        while True:
+            self._dirty.wait()
+            # Let further changes accumulate so they share one write
+            time.sleep(SAVE_DELAY)
+            self.flush_data()
+
+    def flush_data(self):
+        """Write the locker state to disk now"""
+        with self._save_lock:
+            self._dirty.clear()
+            try:
+                self._save_state()
+                logger.info("Locker state saved successfully")
+            except Exception as e:
+                logger.error(f"Error saving locker state: {e}")
+                # Retry on the next save cycle
+                self._dirty.set()
+
+    def _state_snapshot(self, data):
+        """The live part of the data that goes into STATE_FILE"""
+        return {
+            "active_cards": data["active_cards"],
+            "available_lockers": data["available_lockers"]
+        }
+
+    def _save_state(self):
+        """Atomically rewrite STATE_FILE - its size depends on open lockers, not on history"""
+        self._write_json_atomic(STATE_FILE, self._state_snapshot(self.data))
+
+    def _write_json_atomic(self, path, obj, option=None):
+        """Write JSON to a temp file and move it into place so readers never see a partial file"""
+        tmp_file = path + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(obj, option=option))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    def _append_transaction(self, trans):
+        """Append the current version of a transaction to the log"""
         try:
-            with open(DB_FILE, 'w') as f:
-                json.dump(self.data, f, indent=4)
-            logger.info("Database saved successfully")
+            with self._log_lock:
+                with open(TRANSACTION_LOG, 'ab') as f:
+                    f.write(orjson.dumps(trans) + b"\n")
+                    f.flush()
         except Exception as e:
-            logger.error(f"Error saving database: {e}")
+            logger.error(f"Error writing transaction log: {e}")
+
+    def _rewrite_transaction_log(self, transactions):
+        """Replace the transaction log with one entry per transaction in the given dict"""
+        with self._log_lock:
+            # Snapshot under the log lock so no concurrent append is lost
+            tmp_file = TRANSACTION_LOG + ".tmp"
+            with open(tmp_file, 'wb') as f:
+                for trans in list(transactions.values()):
+                    f.write(orjson.dumps(trans) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, TRANSACTION_LOG)
+
+    def _archive_transactions(self):
+        """Move completed transactions past the retention window into the compressed archive"""
+        retention_days = self.config.get("transaction_retention_days", 30)
+        cutoff = iso_timestamp(time.time() - retention_days * 24 * 60 * 60)
+        transactions = self.data["transactions"]
+        
+        # ISO timestamps in the same format compare correctly as strings
+        old = [
+            trans for trans in list(transactions.values())
+            if trans.get("status") == "completed" and (trans.get("pickup_time") or "") < cutoff
+        ]
+        if not old:
+            return 0
+        
+        # Appending creates a new gzip member; readers see one continuous stream
+        with gzip.open(TRANSACTION_ARCHIVE, 'ab') as f:
+            for trans in old:
+                f.write(orjson.dumps(trans) + b"\n")
+        
+        for trans in old:
+            transactions.pop(trans["transaction_id"], None)
+        
+        # Compact the log down to the transactions still kept in memory
+        self._rewrite_transaction_log(transactions)
+        logger.info(f"Archived {len(old)} completed transactions older than {retention_days} days")
+        return len(old)
 
     def unlock_locker(self, locker_id):
-        """Unlock specified locker"""
-        if locker_id not in self.relay_pins:
+        """Unlock specified locker; it is locked again after unlock_duration without blocking the caller"""
+        locker_id = str(locker_id)
+        relay_pin = self.relay_pin_map.get(locker_id)
+        if relay_pin is None:
             logger.error(f"Invalid locker ID: {locker_id}")
             return False
-            
-        relay_pin = self.relay_pins[locker_id]
-        
-        # Activate relay (LOW to turn on)
-        GPIO.output(relay_pin, GPIO.LOW)
-        
-        logger.info(f"Locker {locker_id} unlocked")
         
-        # Keep unlocked for defined duration
-        time.sleep(self.config['unlock_duration'])
+        deadline = time.monotonic() + self.unlock_duration
         
-        # Lock the locker
-        GPIO.output(relay_pin, GPIO.HIGH)
+        with self._relay_cond:
+            # Activate relay (LOW to turn on)
+            GPIO.output(relay_pin, GPIO.LOW)
+            
+            # Schedule the relock
+            self._relay_deadlines[locker_id] = deadline
+            heapq.heappush(self._relay_heap, (deadline, locker_id))
+            self._relay_cond.notify()
         
-        logger.info(f"Locker {locker_id} locked")
+        logger.info(f"Locker {locker_id} unlocked")
         
         return True
 
+    def _relay_closer_loop(self):
+        """Background thread that locks lockers again once their unlock duration has passed"""
+        with self._relay_cond:
+            while True:
+                if not self._relay_heap:
+                    self._relay_cond.wait()
+                    continue
+                
+                deadline, locker_id = self._relay_heap[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._relay_cond.wait(remaining)
+                    continue
+                
+                heapq.heappop(self._relay_heap)
+                
+                # A later unlock of the same locker extended its deadline
+                if self._relay_deadlines.get(locker_id) != deadline:
+                    continue
+                del self._relay_deadlines[locker_id]
+                
+                # Lock the locker
+                GPIO.output(self.relay_pin_map[locker_id], GPIO.HIGH)
+                logger.info(f"Locker {locker_id} locked")
+
     def rfid_reader_loop(self):
         """Background thread that continuously reads RFID cards with improved reliability"""
         rfid_logger.info("Starting RFID reader background thread")
         consecutive_errors = 0
         last_successful_read = time.time()
         read_interval = 0.1  # Base interval between reads
+        skipped_sleep = False  # Whether the previous pass already skipped its sleep
         
         while True:
             try:
                 # Variable timing based on recent success/failure
                 current_interval = read_interval * (1 + min(consecutive_errors, 5))
                 
+                # Sleep until the reader signals a tag instead of polling an empty field
+                if self.rfid_irq_pin is not None and not self.wait_for_card():
+                    continue
+                
                 # Try non-blocking read first to prevent thread blocking
+                is_duplicate = False
                 self.rfid_reads_attempted += 1
                 id, text = self.reader.read_no_block()
                 
                 # Only process if we actually got a card
                 if id is not None:
-                    card_id = str(id)
-                    rfid_logger.info(f"Card detected: {card_id}")
+                    card_id = normalize_card_id(id)
+                    rfid_logger.info("Card detected: %s", card_id)
                     
-                    # Add to queue with timestamp and reduced duplicate handling
-                    with self.card_read_lock:
-                        # Check for duplicates in the last 2 seconds only
-                        now = datetime.now()
-                        current_time_iso = now.isoformat()
-                        
-                        # Check for recent duplicates more intelligently
-                        is_duplicate = False
-                        for existing_card in self.card_queue:
-                            if existing_card["card_id"] == card_id:
-                                # Calculate time difference
-                                existing_time = datetime.fromisoformat(existing_card["timestamp"])
-                                seconds_diff = (now - existing_time).total_seconds()
-                                
-                                # Only consider duplicates within 2 seconds
-                                if seconds_diff < 2.0:
-                                    existing_card["timestamp"] = current_time_iso
-                                    is_duplicate = True
-                                    rfid_logger.debug(f"Duplicate card found within {seconds_diff}s, updating timestamp")
-                                    break
+                    # Check for duplicates in the last 2 seconds only
+                    now = time.monotonic()
+                    
+                    with self.card_latest_lock:
+                        existing_card = self.card_latest.get(card_id)
+                        if existing_card is not None:
+                            # Calculate time difference
+                            seconds_diff = now - existing_card["ts"]
+                            
+                            # Only consider duplicates within 2 seconds
+                            if seconds_diff < 2.0:
+                                existing_card["ts"] = now
+                                existing_card["read_count"] += 1
+                                is_duplicate = True
                         
-                        # Add new card if not a duplicate
                         if not is_duplicate:
-                            self.card_queue.append({
+                            entry = {
                                 "card_id": card_id, 
-                                "timestamp": current_time_iso,
+                                "ts": now,  # time.monotonic() of the latest read
                                 "read_count": 1  # Track how many times we've seen this card
-                            })
-                            
-                        # Keep only the last 10 card reads to prevent memory issues
-                        if len(self.card_queue) > 10:
-                            self.card_queue.pop(0)
+                            }
+                            self.card_latest[card_id] = entry
+                    
+                    if is_duplicate:
+                        rfid_logger.debug("Duplicate card found within %.3fs, updating timestamp", seconds_diff)
+                    else:
+                        # Add new card to the queue
+                        self._enqueue_card(entry)
                     
                     # Update statistics and reset error counters
                     self.rfid_reads_successful += 1
@@ -330,6 +758,18 @@ class RFIDLockerSystem:
                     # If we didn't get a card, gradually return to normal timing
                     read_interval = min(read_interval * 1.1, 0.1)
                 
+                # The read reprogrammed the interrupt registers - re-arm tag detection
+                if self.rfid_irq_pin is not None:
+                    self.arm_rfid_irq()
+                
+                # A duplicate read needs no processing, so go straight back to the
+                # reader - but only once in a row, so a card held on the antenna
+                # can't spin the thread
+                if is_duplicate and not skipped_sleep:
+                    skipped_sleep = True
+                    continue
+                skipped_sleep = False
+                
                 # Adaptive sleep to prevent CPU hogging while staying responsive
                 time.sleep(current_interval)
                 
@@ -340,13 +780,13 @@ class RFIDLockerSystem:
                 
                 # Log with different severity based on how long we've been having issues
                 if consecutive_errors < 5:
-                    rfid_logger.warning(f"Error in RFID reader thread: {e}")
+                    rfid_logger.warning("Error in RFID reader thread: %s", e)
                     time.sleep(0.5)  # Short delay for occasional errors
                 elif consecutive_errors < 20:
-                    rfid_logger.error(f"Persistent errors in RFID reader: {e}, no successful reads for {elapsed:.1f}s")
+                    rfid_logger.error("Persistent errors in RFID reader: %s, no successful reads for %.1fs", e, elapsed)
                     time.sleep(1)  # Medium delay
                 else:
-                    rfid_logger.critical(f"RFID reader may be disconnected or malfunctioning: {e}, no reads for {elapsed:.1f}s")
+                    rfid_logger.critical("RFID reader may be disconnected or malfunctioning: %s, no reads for %.1fs", e, elapsed)
                     
                     # Try to recover the reader after many consecutive errors
                     # More aggressive recovery strategy
@@ -354,62 +794,87 @@ class RFIDLockerSystem:
                         try:
                             rfid_logger.info("Attempting to reinitialize RFID reader...")
                             self.initialize_rfid()
-                            # Small delay after reinitialization
-                            time.sleep(2)
                         except Exception as reset_error:
-                            rfid_logger.critical(f"Failed to reinitialize RFID reader: {reset_error}")
+                            rfid_logger.critical("Failed to reinitialize RFID reader: %s", reset_error)
                     
                     time.sleep(2)  # Longer delay for persistent errors
 
+    def _enqueue_card(self, entry):
+        """Add a card read to the queue, dropping the oldest read when it is full"""
+        # Only the reader thread puts, so the queue can't refill between these calls
+        if self.card_queue.full():
+            try:
+                evicted = self.card_queue.get_nowait()
+            except queue.Empty:
+                evicted = None
+            
+            if evicted is not None:
+                with self.card_latest_lock:
+                    if self.card_latest.get(evicted["card_id"]) is evicted:
+                        del self.card_latest[evicted["card_id"]]
+        
+        self.card_queue.put_nowait(entry)
+
     def get_last_card(self):
         """Get the last card read from the queue with improved reliability and multiple read validation"""
-        with self.card_read_lock:
-            if not self.card_queue:
-                logger.debug("Card queue is empty")
-                return None
-            
-            # Current time for comparison    
-            now = datetime.now()
-            
-            # Debug log the entire queue for troubleshooting
-            rfid_logger.debug(f"Card queue contents: {self.card_queue}")
-            
-            # First, look for cards with multiple reads (more reliable)
-            for i in range(len(self.card_queue) - 1, -1, -1):  # Search backward from most recent
-                card = self.card_queue[i]
-                card_time = datetime.fromisoformat(card["timestamp"])
-                time_diff = (now - card_time).total_seconds()
-                
-                # If this card was seen multiple times and is recent, prioritize it
-                if card.get("read_count", 1) > 1 and time_diff <= self.config.get('card_validity_window', 30):
-                    rfid_logger.info(f"Returning multi-read card: {card}")
-                    return card
-            
-            # Fall back to most recent card if no multiple-read cards found
-            card = self.card_queue[-1]  # Most recent card
-            card_time = datetime.fromisoformat(card["timestamp"])
-            time_diff = (now - card_time).total_seconds()
-            
-            validity_window = self.config.get('card_validity_window', 30)
+        # Peek at the queue without consuming it
+        with self.card_queue.mutex:
+            snapshot = list(self.card_queue.queue)
+        
+        if not snapshot:
+            logger.debug("Card queue is empty")
+            return None
+        
+        # Current time for comparison    
+        now = time.monotonic()
+        
+        # Debug log the entire queue for troubleshooting - skip the repr unless DEBUG is on
+        if rfid_logger.isEnabledFor(logging.DEBUG):
+            rfid_logger.debug("Card queue contents: %r", snapshot)
+        
+        # First, look for cards with multiple reads (more reliable)
+        for card in reversed(snapshot):  # Search backward from most recent
+            time_diff = now - card["ts"]
             
-            if time_diff <= validity_window:
-                rfid_logger.info(f"Returning most recent card: {card}")
-                return card
-            else:
-                rfid_logger.info(f"Card found but too old ({time_diff:.1f}s), not returning")
-                return None
+            # If this card was seen multiple times and is recent, prioritize it
+            if card.get("read_count", 1) > 1 and time_diff <= self.card_validity_window:
+                rfid_logger.info("Returning multi-read card: %r", card)
+                return self._card_for_client(card, now)
+        
+        # Fall back to most recent card if no multiple-read cards found
+        card = snapshot[-1]  # Most recent card
+        time_diff = now - card["ts"]
+        
+        if time_diff <= self.card_validity_window:
+            rfid_logger.info("Returning most recent card: %r", card)
+            return self._card_for_client(card, now)
+        else:
+            rfid_logger.info("Card found but too old (%.1fs), not returning", time_diff)
+            return None
+
+    def _card_for_client(self, card, now):
+        """Build the API view of a queue entry, converting its monotonic read time to an ISO timestamp"""
+        read_time = time.time() - (now - card["ts"])
+        return {
+            "card_id": card["card_id"],
+            "timestamp": iso_timestamp(read_time),
+            "read_count": card["read_count"]
+        }
 
     def clear_card_queue(self):
         """Clear the card queue"""
-        with self.card_read_lock:
-            self.card_queue = []
+        # Nothing ever blocks on put(), so emptying the underlying deque is safe
+        with self.card_queue.mutex:
+            self.card_queue.queue.clear()
+        with self.card_latest_lock:
+            self.card_latest.clear()
         return True
 
     def assign_card_to_locker(self, card_id, locker_id, wash_type_id):
         """Assign a card to a locker with selected wash type"""
         try:
-            # Normalize card_id to string format
-            card_id = str(card_id).strip()
+            # Normalize card_id to its canonical form
+            card_id = normalize_card_id(card_id)
             
             # Double-check card isn't already assigned
             if self.check_card_already_assigned(card_id):
@@ -422,21 +887,17 @@ class RFIDLockerSystem:
                 logger.error(f"Locker {locker_id} is not available")
                 return False, "Locker not available"
 
-            # Get the full wash type information
-            wash_types = self.get_wash_types()
-            selected_wash_type = None
-            
-            for wt in wash_types:
-                if wt['id'] == wash_type_id:
-                    selected_wash_type = wt
-                    break
+            # Get the full wash type information from the current list; a stale list is
+            # refreshed in the background so the drop-off never waits on the server
+            self.refresh_wash_types_async()
+            selected_wash_type = self._wash_types_by_id.get(wash_type_id)
             
             if not selected_wash_type:
                 logger.error(f"Wash type {wash_type_id} not found")
                 return False, "Invalid wash type"
             
             # Create new transaction with device info
-            transaction = LockerTransaction(card_id, locker_id, selected_wash_type)
+            transaction = LockerTransaction(card_id, locker_id, selected_wash_type, device_info=self._device_info)
             
             # Update active cards
             self.data["active_cards"][card_id] = {
@@ -449,14 +910,16 @@ class RFIDLockerSystem:
             if locker_id_str in self.data["available_lockers"]:
                 self.data["available_lockers"].remove(locker_id_str)
             
-            # Add transaction to list
-            self.data["transactions"].append(transaction.to_dict())
+            # Index the transaction by ID and by card for pickup
+            self.data["transactions"][transaction.transaction_id] = transaction.to_dict()
+            self.data["by_card"][card_id] = transaction.transaction_id
+            self._append_transaction(self.data["transactions"][transaction.transaction_id])
             
             # Save changes
             self.save_data()
             
-            # Send update to server
-            self.send_to_server("new_transaction", transaction.to_dict())
+            # Queue update for the server
+            self.queue_event("new_transaction", transaction.to_dict())
             
             return True, f"Card assigned to locker {locker_id} with {selected_wash_type['name']} service"
         except Exception as e:
@@ -465,52 +928,31 @@ class RFIDLockerSystem:
         
     def check_card_already_assigned(self, card_id):
         """Check if a card is already assigned to a locker"""
-        # Normalize card ID to string
-        card_id_str = str(card_id).strip()
+        card_id = normalize_card_id(card_id)
         
-        # Direct lookup
-        if card_id_str in self.data["active_cards"]:
-            return True
-        
-        # Case-insensitive lookup - normalize both for comparison
-        card_id_lower = card_id_str.lower()
-        for active_card in self.data["active_cards"].keys():
-            if str(active_card).lower() == card_id_lower:
-                return True
-        
-        # Also check the transactions to be safe
-        for transaction in self.data["transactions"]:
-            if transaction.get("status") != "completed":
-                trans_card_id = str(transaction.get("card_id", "")).strip().lower()
-                if trans_card_id == card_id_lower:
-                    return True
-        
-        # Not found in any active assignments
-        return False
+        # Active assignments, plus any open transaction to be safe
+        return card_id in self.data["active_cards"] or card_id in self.data["by_card"]
     
+    def _complete_transaction(self, trans):
+        """Mark a stored transaction completed and log it; times come from the same epoch clock as drop-off"""
+        pickup_ts = time.time()
+        trans["status"] = "completed"
+        trans["pickup_time"] = iso_timestamp(pickup_ts)
+        self._append_transaction(trans)
+
     def process_pickup(self, card_id):
         """Process clothes pickup"""
-        # Normalize card_id to string format to ensure consistent comparison
-        card_id_str = str(card_id)
+        # Normalize card_id to ensure consistent comparison
+        card_id_str = normalize_card_id(card_id)
         
         # Add debug logging to help diagnose
         logger.info(f"Processing pickup for card ID: {card_id_str}")
         logger.info(f"Active cards in system: {list(self.data['active_cards'].keys())}")
         
-        # Check if card exists in active cards, using string comparison
+        # Check if card exists in active cards
         if card_id_str not in self.data["active_cards"]:
-            # Try to find by doing a case-insensitive comparison
-            found = False
-            for active_card_id in self.data["active_cards"].keys():
-                if str(active_card_id).lower() == card_id_str.lower():
-                    card_id_str = active_card_id  # Use the version from the database
-                    found = True
-                    logger.info(f"Found card with case-insensitive match: {active_card_id}")
-                    break
-            
-            if not found:
-                logger.error(f"Card {card_id_str} not found in active cards")
-                return False, "Card not associated with any locker"
+            logger.error(f"Card {card_id_str} not found in active cards")
+            return False, "Card not associated with any locker"
         
         # Get locker details
         locker_info = self.data["active_cards"][card_id_str]
@@ -520,83 +962,68 @@ class RFIDLockerSystem:
         logger.info(f"Found active transaction: locker {locker_id}, transaction {transaction_id}")
         logger.info(f"Transactions in system: {len(self.data['transactions'])}")
         
-        # List all transaction IDs for debugging
-        transaction_ids = [t.get("transaction_id") for t in self.data["transactions"]]
-        logger.info(f"Available transaction IDs: {transaction_ids}")
-        
-        # Find transaction - improved matching
-        found_transaction = False
-        for i, trans in enumerate(self.data["transactions"]):
-            # Log each transaction we're checking
-            logger.debug(f"Checking transaction {i}: {trans.get('transaction_id')}")
+        # Find transaction by ID
+        trans = self.data["transactions"].get(transaction_id)
+        if trans is not None:
+            logger.info(f"Found matching transaction: {transaction_id}")
             
-            # Match by transaction ID
-            if trans.get("transaction_id") == transaction_id:
-                found_transaction = True
-                logger.info(f"Found matching transaction: {trans.get('transaction_id')}")
-                
-                # Update transaction
-                self.data["transactions"][i]["status"] = "completed"
-                self.data["transactions"][i]["pickup_time"] = datetime.now().isoformat()
-                
-                # Format wash_type before sending
-                transaction_data = self.data["transactions"][i].copy()
-                if 'wash_type' in transaction_data and isinstance(transaction_data['wash_type'], dict):
-                    transaction_data['wash_type'] = transaction_data['wash_type'].get('name', 'Unknown')
-                
-                # Unlock locker
-                self.unlock_locker(locker_id)
-                
-                # Remove card from active cards
-                del self.data["active_cards"][card_id_str]
-                
-                # Add locker back to available list
-                locker_id_str = str(locker_id)  # Ensure locker_id is string
-                if locker_id_str not in self.data["available_lockers"]:
-                    self.data["available_lockers"].append(locker_id_str)
-                
-                # Save changes
-                self.save_data()
-                
-                # Send update to server
-                self.send_to_server("pickup_complete", transaction_data)
-                
-                return True, f"Clothes picked up from locker {locker_id}"
+            # Update transaction
+            self._complete_transaction(trans)
+            
+            # Unlock locker
+            self.unlock_locker(locker_id)
+            
+            # Remove card from active cards
+            del self.data["active_cards"][card_id_str]
+            self.data["by_card"].pop(card_id_str, None)
+            
+            # Add locker back to available list
+            locker_id_str = str(locker_id)  # Ensure locker_id is string
+            if locker_id_str not in self.data["available_lockers"]:
+                self.data["available_lockers"].append(locker_id_str)
+            
+            # Save changes - a completed pickup is written immediately
+            self.flush_data()
+            
+            # Queue update for the server
+            self.queue_event("pickup_complete", trans)
+            
+            return True, f"Clothes picked up from locker {locker_id}"
         
         # If we get here, we didn't find the transaction
         logger.error(f"Transaction {transaction_id} not found for card {card_id_str}")
         
-        # As a fallback, try to find any transaction by card ID
+        # As a fallback, try to find the open transaction for this card ID
         fallback_found = False
-        for i, trans in enumerate(self.data["transactions"]):
-            if trans.get("card_id") == card_id_str and trans.get("status") != "completed":
-                fallback_found = True
-                logger.info(f"Found fallback transaction by card ID: {trans.get('transaction_id')}")
-                
-                # Use this transaction
-                transaction_id = trans.get("transaction_id")
-                locker_id = trans.get("locker_id")
-                
-                # Update transaction
-                self.data["transactions"][i]["status"] = "completed"
-                self.data["transactions"][i]["pickup_time"] = datetime.now().isoformat()
-                
-                # Unlock locker
-                self.unlock_locker(locker_id)
-                
-                # Remove card from active cards
-                if card_id_str in self.data["active_cards"]:
-                    del self.data["active_cards"][card_id_str]
-                
-                # Add locker back to available list
-                locker_id_str = str(locker_id)  # Ensure locker_id is string
-                if locker_id_str not in self.data["available_lockers"]:
-                    self.data["available_lockers"].append(locker_id_str)
-                
-                # Save changes
-                self.save_data()
-                
-                return True, f"Clothes picked up from locker {locker_id} (fallback)"
+        fallback_id = self.data["by_card"].get(card_id_str)
+        trans = self.data["transactions"].get(fallback_id) if fallback_id else None
+        if trans is not None and trans.get("status") != "completed":
+            fallback_found = True
+            logger.info(f"Found fallback transaction by card ID: {fallback_id}")
+            
+            # Use this transaction
+            locker_id = trans.get("locker_id")
+            
+            # Update transaction
+            self._complete_transaction(trans)
+            
+            # Unlock locker
+            self.unlock_locker(locker_id)
+            
+            # Remove card from active cards
+            if card_id_str in self.data["active_cards"]:
+                del self.data["active_cards"][card_id_str]
+            del self.data["by_card"][card_id_str]
+            
+            # Add locker back to available list
+            locker_id_str = str(locker_id)  # Ensure locker_id is string
+            if locker_id_str not in self.data["available_lockers"]:
+                self.data["available_lockers"].append(locker_id_str)
+            
+            # Save changes - a completed pickup is written immediately
+            self.flush_data()
+            
+            return True, f"Clothes picked up from locker {locker_id} (fallback)"
         
         # Special case - reset the system if something is corrupted
         if not fallback_found and card_id_str in self.data["active_cards"]:
@@ -605,6 +1032,7 @@ class RFIDLockerSystem:
             
             # Remove card from active cards
             del self.data["active_cards"][card_id_str]
+            self.data["by_card"].pop(card_id_str, None)
             
             # Add locker back to available list
             locker_id_str = str(locker_id)
@@ -612,7 +1040,7 @@ class RFIDLockerSystem:
                 self.data["available_lockers"].append(locker_id_str)
             
             # Save changes
-            self.save_data()
+            self.flush_data()
             
             return True, f"Locker {locker_id} unlocked and reset"
         
@@ -620,35 +1048,22 @@ class RFIDLockerSystem:
     
     def send_to_server(self, action, data):
         try:
-            # Make a copy of the data
-            payload_data = data.copy() if isinstance(data, dict) else data
-            
-            # Format the wash_type properly
-            if isinstance(payload_data, dict) and 'wash_type' in payload_data:
-                if isinstance(payload_data['wash_type'], dict):
-                    payload_data['wash_type'] = payload_data['wash_type'].get('name', 'Unknown')
-            
-            # Build payload
+            # Build payload - transactions already carry a flat wash_type
             payload = {
                 "action": action,
                 "api_key": self.config["server_api_key"],
                 "timestamp": datetime.now().isoformat(),
-                "data": payload_data
+                "data": data
             }
             
             # Explicitly serialize to JSON to verify format
-            json_payload = json.dumps(payload)
-            logger.debug(f"JSON payload: {json_payload}")
+            json_payload = orjson.dumps(payload)
+            logger.debug("JSON payload: %s", json_payload)
             
-            # Send using the serialized JSON
-            headers = {
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.post(
+            # Send using the serialized JSON over the pooled session
+            response = self.http.post(
                 f"{self.config['server_url']}/{action}",
-                data=json_payload,  # Use the serialized JSON string
-                headers=headers,
+                data=json_payload,  # Use the serialized JSON bytes
                 timeout=5
             )
             
@@ -678,29 +1093,141 @@ class RFIDLockerSystem:
             logger.error(f"Error communicating with server: {e}")
             return False
 
+    def queue_event(self, action, data):
+        """Hand an event to the sync thread so the caller doesn't wait on the network"""
+        event = {
+            "action": action,
+            "timestamp": datetime.now().isoformat(),
+            "data": data
+        }
+        try:
+            self.event_q.put_nowait((event, 0))
+        except queue.Full:
+            logger.error(f"Server event queue full, dropping {action} event")
+            self._mark_unsynced(event)
+
+    def _mark_unsynced(self, event):
+        """Remember the transaction behind a dropped event so the next sync carries it instead"""
+        transaction_id = event["data"].get("transaction_id")
+        if transaction_id:
+            with self._unsynced_lock:
+                self._unsynced_tx_ids.add(transaction_id)
+
     def sync_with_server_loop(self):
-        """Periodically sync data with server"""
+        """Send queued events in batches, periodically sync data with server and archive old transactions"""
+        next_sync = time.monotonic()
+        next_archive = time.monotonic()
         while True:
+            if time.monotonic() >= next_archive:
+                try:
+                    self._archive_transactions()
+                except Exception as e:
+                    logger.error(f"Error archiving transactions: {e}")
+                next_archive = time.monotonic() + ARCHIVE_INTERVAL
+            
+            if time.monotonic() >= next_sync:
+                try:
+                    # The sync payload is just this summary - skip the POST if the server already has it
+                    signature = (
+                        len(self.data["active_cards"]),
+                        tuple(self.data["available_lockers"]),
+                        len(self.data["transactions"])
+                    )
+                    with self._unsynced_lock:
+                        pending_ids = list(self._unsynced_tx_ids)
+                    
+                    if signature == self._last_sync_signature and not pending_ids:
+                        logger.debug("Locker state unchanged since last sync, skipping")
+                    else:
+                        # Only transactions the server missed go along, not the whole history
+                        transactions = self.data["transactions"]
+                        delta = [transactions[tid] for tid in pending_ids if tid in transactions]
+                        if self.send_to_server("sync", {
+                            "active_cards": signature[0],
+                            "available_lockers": list(signature[1]),
+                            "total_transactions": signature[2],
+                            "delta_transactions": delta
+                        }):
+                            self._last_sync_signature = signature
+                            with self._unsynced_lock:
+                                self._unsynced_tx_ids.difference_update(pending_ids)
+                except Exception as e:
+                    logger.error(f"Error during server sync: {e}")
+                next_sync = time.monotonic() + SYNC_INTERVAL
+            
+            # Wait for events until the next sync is due
             try:
-                self.send_to_server("sync", {
-                    "active_cards": len(self.data["active_cards"]),
-                    "available_lockers": self.data["available_lockers"],
-                    "total_transactions": len(self.data["transactions"])
-                })
+                batch = self._collect_events(max(0.0, next_sync - time.monotonic()))
+                if batch and not self._send_event_batch(batch):
+                    # Back off so a server outage doesn't turn into a retry loop
+                    time.sleep(EVENT_RETRY_DELAY)
             except Exception as e:
-                logger.error(f"Error during server sync: {e}")
-            
-            # Sleep for 5 minutes before next sync
-            time.sleep(300)
+                logger.error(f"Error sending events to server: {e}")
+
+    def _collect_events(self, timeout):
+        """Wait for a queued event, then gather any others arriving within a second"""
+        try:
+            batch = [self.event_q.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        
+        deadline = time.monotonic() + 1.0
+        while len(batch) < EVENT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.event_q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send_event_batch(self, batch):
+        """POST a batch of events; requeue them for a later attempt on failure"""
+        if self.send_to_server("batch", {"events": [event for event, attempts in batch]}):
+            return True
+        
+        for event, attempts in batch:
+            if attempts + 1 >= EVENT_MAX_ATTEMPTS:
+                logger.error(f"Giving up on {event['action']} event after {attempts + 1} attempts")
+                self._mark_unsynced(event)
+                continue
+            try:
+                self.event_q.put_nowait((event, attempts + 1))
+            except queue.Full:
+                logger.error(f"Server event queue full, dropping {event['action']} event")
+                self._mark_unsynced(event)
+        return False
+
+    def _memoized_json(self, key, build):
+        """Return build()'s result serialized to JSON bytes, reusing it for STATUS_CACHE_TTL seconds"""
+        now = time.monotonic()
+        with self._memo_lock:
+            cached = self._memo.get(key)
+            if cached is not None and now - cached[0] < STATUS_CACHE_TTL:
+                return cached[1]
+            payload = orjson.dumps(build())
+            self._memo[key] = (now, payload)
+        return payload
+
+    def get_status_json(self):
+        """Get current system status as JSON bytes, shared by polling clients"""
+        return self._memoized_json("status", self.get_system_status)
+
+    def get_health_json(self):
+        """Get system health information as JSON bytes, shared by polling clients"""
+        return self._memoized_json("health", self.get_health)
 
     def get_system_status(self):
         """Get current system status"""
         # Calculate time since last successful RFID read
         rfid_status = "OK"
         last_read_time = "Never"
+        attempted = self.rfid_reads_attempted
+        last_successful_read = self.last_successful_read
         
-        if self.last_successful_read is not None:
-            time_diff = time.time() - self.last_successful_read
+        if last_successful_read is not None:
+            time_diff = time.time() - last_successful_read
             last_read_time = f"{int(time_diff)} seconds ago"
             
             if time_diff > 300:  # 5 minutes
@@ -711,17 +1238,56 @@ class RFIDLockerSystem:
             "active_cards": len(self.data["active_cards"]),
             "available_lockers": self.data["available_lockers"],
             "total_transactions": len(self.data["transactions"]),
-            "last_sync": datetime.now().isoformat(),
+            "last_sync": datetime.now(),  # Formatted by the JSON provider
             "rfid": {
                 "status": rfid_status,
                 "last_read": last_read_time,
                 "error_count": self.rfid_errors,
-                "success_rate": (self.rfid_reads_successful / self.rfid_reads_attempted * 100) if self.rfid_reads_attempted > 0 else 0
+                "success_rate": (self.rfid_reads_successful / attempted * 100) if attempted > 0 else 0
             }
         }
 
     def get_wash_types(self):
         """Get available wash types from server, fall back to local config if server unreachable"""
+        if self._wash_types_fresh():
+            return self._wash_types_cache
+        
+        # Only one request thread talks to the server, the others wait for its result
+        with self._wash_types_lock:
+            # A fetch may have finished while this caller was waiting for the lock
+            if self._wash_types_fresh():
+                return self._wash_types_cache
+            inflight = self._wash_types_inflight
+            if inflight is None:
+                self._wash_types_inflight = threading.Event()
+        
+        if inflight is not None:
+            inflight.wait(timeout=5)
+            return self._wash_types_cache or self.config["wash_types"]
+        
+        try:
+            return self._fetch_wash_types()
+        finally:
+            with self._wash_types_lock:
+                inflight, self._wash_types_inflight = self._wash_types_inflight, None
+            inflight.set()
+
+    def refresh_wash_types_async(self):
+        """Refresh stale wash types on a background thread; callers keep using the current index"""
+        if self._wash_types_fresh():
+            return
+        with self._wash_types_lock:
+            if self._wash_types_inflight is not None:
+                return
+        threading.Thread(target=self.get_wash_types, daemon=True).start()
+
+    def _wash_types_fresh(self):
+        """Whether the cached wash types can be served without asking the server"""
+        return self._wash_types_cache is not None and time.monotonic() < self._wash_types_expires
+
+    def _fetch_wash_types(self):
+        """Fetch wash types from the server, falling back to cached or local ones on failure"""
+        self._wash_types_fetched_at = time.monotonic()
         try:
             # Attempt to fetch wash types from server with API key in POST request
             payload = {
@@ -730,9 +1296,9 @@ class RFIDLockerSystem:
             }
             
             logger.info(f"Fetching wash types from server: {self.config['server_url']}/get_wash_types")
-            response = requests.post(
+            response = self.http.post(
                 f"{self.config['server_url']}/get_wash_types",
-                json=payload,
+                data=orjson.dumps(payload),
                 timeout=5
             )
             
@@ -756,38 +1322,52 @@ class RFIDLockerSystem:
                     
                     # Cache the wash types in memory for backup
                     self.server_wash_types = wash_types
+                    self._index_wash_types(wash_types)
+                    self._wash_types_cache = wash_types
+                    self._wash_types_expires = time.monotonic() + self.wash_types_cache_ttl
                     return wash_types
                 else:
                     logger.warning("Server returned empty wash types list, using local config")
             else:
-                logger.warning(f"Server error when fetching wash types: {response.status_code}")
-                try:
-                    error_data = response.json()
-                    logger.warning(f"Error details: {error_data}")
-                except:
-                    logger.warning(f"Response text: {response.text}")
+                logger.warning("Server error when fetching wash types: %s", response.status_code)
+                logger.warning("Server error body: %s", response.text[:500])
         except Exception as e:
             logger.error(f"Error fetching wash types from server: {e}")
         
         # Fall back to server-cached wash types if available
-        if hasattr(self, 'server_wash_types') and self.server_wash_types:
+        if self.server_wash_types:
             logger.info("Using cached server wash types")
-            return self.server_wash_types
-            
-        # Fall back to local config if server unreachable or returned error
-        logger.info("Using local config wash types")
-        return self.config["wash_types"]
+            fallback = self.server_wash_types
+        else:
+            # Fall back to local config if server unreachable or returned error
+            logger.info("Using local config wash types")
+            fallback = self.config["wash_types"]
+        
+        # Serve the fallback for a while instead of retrying the server on every request
+        self._wash_types_cache = fallback
+        self._wash_types_expires = time.monotonic() + WASH_TYPES_RETRY_DELAY
+        return fallback
+
+    def invalidate_wash_types(self):
+        """Make the next get_wash_types call fetch from the server, at most once per WASH_TYPES_MIN_REFRESH"""
+        self._wash_types_expires = min(self._wash_types_expires, self._wash_types_fetched_at + WASH_TYPES_MIN_REFRESH)
+        logger.info("Wash types cache invalidated")
 
     def get_health(self):
         """Get system health information"""
+        # Read the counters the reader thread updates once, and the clock once
+        last_successful_read = self.last_successful_read
+        age = None if last_successful_read is None else time.time() - last_successful_read
+        attempted = self.rfid_reads_attempted
+        
         health_data = {
             "status": "healthy",
             "uptime": "unknown",  # Would need to track start time
             "rfid_reader": {
-                "status": "OK" if self.last_successful_read is not None and (time.time() - self.last_successful_read) < 300 else "WARNING",
-                "last_successful_read": None if self.last_successful_read is None else f"{int(time.time() - self.last_successful_read)} seconds ago",
+                "status": "OK" if age is not None and age < 300 else "WARNING",
+                "last_successful_read": None if age is None else f"{int(age)} seconds ago",
                 "error_count": self.rfid_errors,
-                "read_success_rate": f"{(self.rfid_reads_successful / self.rfid_reads_attempted * 100):.1f}%" if self.rfid_reads_attempted > 0 else "0%"
+                "read_success_rate": f"{(self.rfid_reads_successful / attempted * 100):.1f}%" if attempted > 0 else "0%"
             },
             "available_lockers": len(self.data["available_lockers"]),
             "active_transactions": len(self.data["active_cards"]),
@@ -802,8 +1382,84 @@ class RFIDLockerSystem:
         return health_data
 
 
+# Request bodies, decoded and validated straight from the raw bytes
+# Required fields default to UNSET so the handlers can report them as missing themselves
+class DropOffRequest(msgspec.Struct):
+    card_id: Union[str, int, msgspec.UnsetType] = msgspec.UNSET
+    wash_type: Union[int, str, dict, msgspec.UnsetType] = msgspec.UNSET
+
+
+class InvalidateWashTypesRequest(msgspec.Struct):
+    api_key: str
+
+
+class PickUpRequest(msgspec.Struct):
+    card_id: Union[str, int, msgspec.UnsetType] = msgspec.UNSET
+
+
+class UpdateDeviceInfoRequest(msgspec.Struct):
+    device_name: Union[str, msgspec.UnsetType] = msgspec.UNSET
+    device_location: Union[str, msgspec.UnsetType] = msgspec.UNSET
+    system_name: Union[str, msgspec.UnsetType] = msgspec.UNSET
+
+
+def decode_request(schema):
+    """Decode the request body into the given msgspec schema, or None for a null body.
+
+    Malformed JSON aborts with a 400; wrongly typed fields raise msgspec.ValidationError.
+    """
+    try:
+        return msgspec.json.decode(request.get_data(cache=False), type=Optional[schema])
+    except msgspec.ValidationError:
+        raise
+    except msgspec.DecodeError:
+        abort(make_response(jsonify({"success": False, "message": "Invalid JSON"}), 400))
+
+
+def cached_json_response(payload, etag, max_age=None):
+    """Serve prebuilt JSON bytes with an ETag, answering a matching If-None-Match with 304.
+
+    Without max_age clients revalidate on every use, which costs only a 304.
+    """
+    resp = Response(payload, mimetype="application/json")
+    resp.set_etag(etag)
+    if max_age is None:
+        resp.cache_control.no_cache = True
+    else:
+        resp.cache_control.max_age = max_age
+    return resp.make_conditional(request)
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson instead of the stdlib json module"""
+
+    sort_keys = False  # Sorting costs time on every response and the clients don't rely on key order
+    compact = True  # No indentation whitespace on the wire
+
+    @staticmethod
+    def _default(obj):
+        # Types orjson doesn't handle natively but Flask's default provider does
+        if isinstance(obj, Decimal):
+            return str(obj)
+        if hasattr(obj, "__html__"):
+            return str(obj.__html__())
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if not self.compact:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self._default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for all routes
 
 # Initialize locker system
@@ -813,16 +1469,8 @@ locker_system = None
 def get_device_info():
     """Get device information"""
     global locker_system
-    
-    device_info = {
-        "device_name": locker_system.config.get("device_name", "unknown-device"),
-        "device_location": locker_system.config.get("device_location", "unknown-location"),
-        "system_name": locker_system.config.get("system_name", "Laundry Locker System"),
-        "api_version": "1.1.0",  # Add version information
-        "uptime": "unknown",  # You could add real uptime tracking if needed
-    }
-    
-    return jsonify(device_info)
+    # Prebuilt whenever the device information changes
+    return cached_json_response(*locker_system._device_info_payload)
 
 @app.route('/api/update-device-info', methods=['POST'])
 def update_device_info():
@@ -830,28 +1478,29 @@ def update_device_info():
     global locker_system
     
     try:
-        data = request.json
-        if not data:
+        data = decode_request(UpdateDeviceInfoRequest)
+    except msgspec.ValidationError as e:
+        return jsonify({"success": False, "message": str(e)})
+    
+    try:
+        updates = {}
+        if data is not None:
+            updates = {k: v for k, v in msgspec.structs.asdict(data).items() if v is not msgspec.UNSET}
+        if not updates:
             return jsonify({"success": False, "message": "Missing request data"})
         
-        # Update device information
-        if "device_name" in data:
-            locker_system.config["device_name"] = data["device_name"]
-        
-        if "device_location" in data:
-            locker_system.config["device_location"] = data["device_location"]
-            
-        if "system_name" in data:
-            locker_system.config["system_name"] = data["system_name"]
-        
-        # Save the updated configuration
-        try:
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(locker_system.config, f, indent=4)
-            logger.info("Device information updated and saved")
-        except Exception as e:
-            logger.error(f"Error saving configuration: {e}")
-            return jsonify({"success": False, "message": f"Error saving configuration: {str(e)}"})
+        # Update device information and save it, unless nothing actually changed
+        if any(locker_system.config.get(k) != v for k, v in updates.items()):
+            locker_system.config.update(updates)
+            locker_system.refresh_device_info()
+            try:
+                locker_system.save_config()
+                logger.info("Device information updated and saved")
+            except Exception as e:
+                logger.error(f"Error saving configuration: {e}")
+                return jsonify({"success": False, "message": f"Error saving configuration: {str(e)}"})
+        else:
+            logger.info("Device information unchanged, configuration not rewritten")
         
         return jsonify({
             "success": True, 
@@ -871,30 +1520,37 @@ def update_device_info():
 def get_status():
     """Get system status"""
     global locker_system
-    return jsonify(locker_system.get_system_status())
+    return Response(locker_system.get_status_json(), mimetype="application/json")
 
 @app.route('/api/health', methods=['GET'])
 def get_health():
     """Get system health information"""
     global locker_system
-    return jsonify(locker_system.get_health())
+    return Response(locker_system.get_health_json(), mimetype="application/json")
 
 @app.route('/api/wash-types', methods=['GET'])
 def get_wash_types():
     """Get available wash types"""
     global locker_system
-    wash_types = locker_system.get_wash_types()
+    # Refresh from the server if due; the payload is rebuilt whenever the list changes
+    locker_system.get_wash_types()
+    return cached_json_response(*locker_system._wash_types_payload, max_age=60)
+
+@app.route('/api/invalidate-wash-types', methods=['POST'])
+def invalidate_wash_types():
+    """Drop the cached wash types so the next request refetches them from the server"""
+    global locker_system
     
-    # If this is our local configuration, we might need to adapt it for the UI
-    if not any('description' in wt for wt in wash_types):
-        # Add missing fields for compatibility
-        for wash_type in wash_types:
-            if 'description' not in wash_type:
-                wash_type['description'] = f"{wash_type['name']} service"
-            if 'estimated_time' not in wash_type:
-                wash_type['estimated_time'] = 60  # Default 60 minutes
+    # Only the server, which shares the device's API key, may force a refetch
+    try:
+        data = decode_request(InvalidateWashTypesRequest)
+    except msgspec.ValidationError:
+        data = None
+    if data is None or not hmac.compare_digest(data.api_key, locker_system.config["server_api_key"]):
+        return jsonify({"success": False, "message": "Invalid API key"}), 403
     
-    return jsonify(wash_types)
+    locker_system.invalidate_wash_types()
+    return jsonify({"success": True})
 
 @app.route('/api/read-card', methods=['GET'])
 def read_card():
@@ -925,23 +1581,23 @@ def drop_off():
     """Process drop off"""
     global locker_system
     
-    data = request.json
-    if not data or "card_id" not in data or "wash_type" not in data:
+    try:
+        data = decode_request(DropOffRequest)
+    except msgspec.ValidationError as e:
+        return jsonify({"success": False, "message": str(e)})
+    if data is None or data.card_id is msgspec.UNSET or data.wash_type is msgspec.UNSET:
         return jsonify({"success": False, "message": "Missing required fields"})
     
     # Get and normalize card ID
-    card_id = str(data["card_id"]).strip()
+    card_id = normalize_card_id(data.card_id)
     logger.info(f"Drop-off request for card: {card_id}")
     
     # Check if card already has an active assignment
     if locker_system.check_card_already_assigned(card_id):
         logger.warning(f"Card {card_id} already has an active assignment")
-        # Get the assigned locker if possible
-        locker_id = "unknown"
-        for active_card, info in locker_system.data["active_cards"].items():
-            if str(active_card).lower() == card_id.lower():
-                locker_id = info.get("locker_id", "unknown")
-                break
+        # Get the assigned locker if possible - active_cards is keyed by normalized card ID
+        info = locker_system.data["active_cards"].get(card_id)
+        locker_id = info.get("locker_id", "unknown") if info else "unknown"
         
         return jsonify({
             "success": False, 
@@ -957,7 +1613,7 @@ def drop_off():
     locker_id = locker_system.data["available_lockers"][0]
     
     # Get wash type - if it's a string, we need to look up the ID
-    wash_type_param = data["wash_type"]
+    wash_type_param = data.wash_type
     wash_type_id = None
     
     # If wash_type is already a dict with ID
@@ -968,12 +1624,10 @@ def drop_off():
         wash_type_id = wash_type_param
     # If wash_type is a name string, we need to look up the ID
     else:
-        # Get available wash types (assuming this is accessible)
-        wash_types = locker_system.get_wash_types()  # Implement this method
-        for wash_type in wash_types:
-            if wash_type["name"] == wash_type_param:
-                wash_type_id = wash_type["id"]
-                break
+        # Resolve against the current index - no server round-trip; a stale list is refreshed in the background
+        locker_system.refresh_wash_types_async()
+        if isinstance(wash_type_param, str):
+            wash_type_id = locker_system._wash_types_by_name.get(wash_type_param)
         
         if not wash_type_id:
             logger.error(f"Wash type {wash_type_param} not found")
@@ -983,7 +1637,7 @@ def drop_off():
     
     # Process assignment
     success, message = locker_system.assign_card_to_locker(
-        data["card_id"], 
+        card_id, 
         locker_id, 
         wash_type_id
     )
@@ -1004,12 +1658,15 @@ def pick_up():
     """Process pick up"""
     global locker_system
     
-    data = request.json
-    if not data or "card_id" not in data:
+    try:
+        data = decode_request(PickUpRequest)
+    except msgspec.ValidationError as e:
+        return jsonify({"success": False, "message": str(e)})
+    if data is None or data.card_id is msgspec.UNSET:
         return jsonify({"success": False, "message": "Missing card_id"})
     
-    # Make sure card_id is a string
-    card_id = str(data["card_id"])
+    # Make sure card_id is in canonical form
+    card_id = normalize_card_id(data.card_id)
     
     logger.info(f"Pickup request for card: {card_id}")
     
@@ -1053,12 +1710,23 @@ def start_api_server(host="0.0.0.0", port=5000):
     # Initialize locker system
     locker_system = RFIDLockerSystem()
     
+    # Write out pending changes when systemd stops the service
+    def handle_sigterm(signum, frame):
+        logger.info("SIGTERM received, saving data before exit")
+        locker_system.flush_data()
+        sys.exit(0)
+    
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
+    # Full GPIO teardown happens only when the process exits
+    atexit.register(GPIO.cleanup)
+    
     # Set Flask to handle exceptions properly
     app.config['PROPAGATE_EXCEPTIONS'] = True
     
-    # Start Flask app
+    # Serve through waitress so a slow request doesn't hold up the polling clients
     try:
-        app.run(host=host, port=port)
+        serve(app, host=host, port=port, threads=8)
     except Exception as e:
         logger.critical(f"Failed to start API server: {e}", exc_info=True)
         sys.exit(1)
@@ -1076,5 +1744,7 @@ if __name__ == "__main__":
         start_api_server(host, port)
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
+        if locker_system is not None:
+            locker_system.flush_data()
     except Exception as e:
         logger.critical(f"Unhandled exception: {e}", exc_info=True)
\ No newline at end of file
@@ -136,7 +136,7 @@ source "$VENV_DIR/bin/activate"
 
 # Install Python requirements in the virtual environment
 print_header "Installing Python requirements in virtual environment"
-pip install Flask Flask-CORS RPi.GPIO mfrc522 requests
+pip install Flask Flask-CORS RPi.GPIO mfrc522 requests orjson waitress msgspec
 
 # Copy project files
 print_header "Copying project files"